@@ -1,10 +1,20 @@
 from flask import Flask
 from config import Config
+from app.utils.handler_registry import HandlerRegistry
+from app.utils.json_provider import ORJSONProvider
+from app.utils.indexing_jobs import IndexingJobManager
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.json = ORJSONProvider(app)
+
+    # Handler werden einmal pro App erstellt und zwischen Requests geteilt
+    app.extensions['handlers'] = HandlerRegistry(app.config)
+
+    # Indexierung läuft im Hintergrund, der Status wird über die API abgefragt
+    app.extensions['indexing_jobs'] = IndexingJobManager()
 
     # Routen registrieren
     from app.routes import main
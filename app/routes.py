@@ -1,11 +1,6 @@
 from flask import Blueprint, render_template, request, jsonify, current_app
-import os
-import json
-from app.utils.dropbox_handler import DropboxHandler
-from app.utils.pdf_processor import OCRDocumentProcessor
-from app.utils.vector_store import VectorStore
-from app.utils.openai_handler import OpenAIHandler
 import logging
+from contextlib import closing
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,71 +16,100 @@ def index():
 
 @main.route('/api/index-documents', methods=['POST'])
 def index_documents():
-    """Dokumente aus Dropbox laden und indexieren"""
+    """Indexierung der Dokumente aus Dropbox im Hintergrund starten"""
     try:
-        # Dropbox-Verbindung herstellen
-        dropbox_token = current_app.config['DROPBOX_ACCESS_TOKEN']
-        dropbox_path = current_app.config['DROPBOX_PDF_PATH']
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-
-        # Qdrant-Einstellungen
-        qdrant_url = current_app.config['QDRANT_URL']
-        qdrant_api_key = current_app.config['QDRANT_API_KEY']
-        collection_name = current_app.config['QDRANT_COLLECTION_NAME']
-
-        # OpenAI-Einstellungen
-        openai_api_key = current_app.config['OPENAI_API_KEY']
-        embedding_model = current_app.config['OPENAI_EMBEDDING_MODEL']
-
-        # PDF-Verarbeitungseinstellungen
-        chunk_size = current_app.config['CHUNK_SIZE']
-        chunk_overlap = current_app.config['CHUNK_OVERLAP']
-
-        # Handler initialisieren
-        dropbox_handler = DropboxHandler(dropbox_token)
-        pdf_processor = OCRDocumentProcessor(chunk_size, chunk_overlap)  # Hier die neue Klasse verwenden
-        vector_store = VectorStore(qdrant_url, collection_name, api_key=qdrant_api_key)
-        openai_handler = OpenAIHandler(openai_api_key, embedding_model=embedding_model)
-
-        # Bisherigen Index löschen
-        vector_store.clear_collection()
-
-        # PDFs von Dropbox herunterladen
-        logger.info(f"Lade PDFs von Dropbox-Pfad: {dropbox_path}")
-        pdf_paths = dropbox_handler.download_all_pdfs(dropbox_path, upload_folder)
-
-        if not pdf_paths:
+        job_id, created = current_app.extensions['indexing_jobs'].submit(
+            run_indexing,
+            current_app.extensions['handlers'],
+            current_app.config['DROPBOX_PDF_PATH']
+        )
+
+        # Jeder Lauf löscht den Index, daher keinen zweiten Lauf einreihen
+        if not created:
             return jsonify({
                 "success": False,
-                "message": "Keine PDF-Dateien in Dropbox gefunden"
-            }), 404
-
-        # PDFs verarbeiten und in Chunks aufteilen
-        chunks = pdf_processor.process_multiple_pdfs(pdf_paths)
-
-        # Embeddings erstellen
-        chunks_with_embeddings = openai_handler.get_embeddings_batch(chunks)
-
-        # In Vektordatenbank speichern
-        vector_store.store_embeddings(chunks_with_embeddings)
-
-        # Dateien nach Verarbeitung löschen
-        for pdf_path in pdf_paths:
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
+                "job_id": job_id,
+                "message": "Indexierung läuft bereits"
+            }), 409
 
         return jsonify({
             "success": True,
-            "message": f"{len(chunks)} Chunks aus {len(pdf_paths)} PDFs erfolgreich indexiert"
-        })
+            "job_id": job_id,
+            "message": "Indexierung gestartet"
+        }), 202
     except Exception as e:
-        logger.error(f"Fehler beim Indexieren der Dokumente: {str(e)}")
+        logger.error(f"Fehler beim Starten der Indexierung: {str(e)}")
         return jsonify({
             "success": False,
             "message": f"Fehler beim Indexieren: {str(e)}"
         }), 500
 
 
+@main.route('/api/index-documents/<job_id>', methods=['GET'])
+def get_indexing_status(job_id):
+    """Status eines Indexierungsauftrags abfragen"""
+    job = current_app.extensions['indexing_jobs'].get(job_id)
+
+    if job is None:
+        return jsonify({
+            "success": False,
+            "message": "Unbekannter Indexierungsauftrag"
+        }), 404
+
+    return jsonify({"success": True, **job})
+
+
+def run_indexing(report_progress, handlers, dropbox_path):
+    """Dokumente aus Dropbox laden und indexieren (läuft im Hintergrund)"""
+    dropbox_handler = handlers['dropbox']
+    pdf_processor = handlers['pdf_processor']
+    vector_store = handlers['vector_store']
+    openai_handler = handlers['openai']
+    # Vor dem try abrufen: schlägt das Erstellen fehl (z.B. ungültige REDIS_URL), darf das im finally
+    # nicht den eigentlichen Fehler der Indexierung verdecken
+    response_cache = handlers['response_cache']
+
+    try:
+        # Bisherigen Index löschen
+        vector_store.clear_collection()
+
+        # Während des gesamten Imports keinen HNSW-Index aufbauen
+        with vector_store.pause_indexing():
+            # PDFs in Dropbox suchen
+            logger.info(f"Suche PDFs im Dropbox-Pfad: {dropbox_path}")
+            report_progress(message="PDFs werden in Dropbox gesucht")
+            pdf_files = dropbox_handler.list_pdf_files(dropbox_path)
+
+            if not pdf_files:
+                raise LookupError("Keine PDF-Dateien in Dropbox gefunden")
+
+            # PDFs werden erst kurz vor der Verarbeitung in den Speicher geladen und in Gruppen eingebettet
+            # und gespeichert, während die Worker bereits die nächsten PDFs verarbeiten
+            report_progress(message=f"{len(pdf_files)} PDFs werden verarbeitet")
+            chunk_count = 0
+
+            # closing: bei einem Fehler Downloads und Prozess-Pool sofort beenden, nicht erst bei der Garbage Collection
+            with closing(dropbox_handler.iter_pdf_bytes(pdf_files)) as downloads, \
+                    closing(pdf_processor.iter_chunk_batches(downloads)) as chunk_batches:
+                for chunks in chunk_batches:
+                    # Embeddings erstellen
+                    embeddings = openai_handler.get_embeddings_batch(chunks)
+
+                    # In Vektordatenbank speichern
+                    vector_store.store_embeddings(chunks, embeddings, start_id=chunk_count)
+                    chunk_count += len(chunks)
+                    report_progress(message=f"{chunk_count} Chunks indexiert")
+    finally:
+        # Zwischengespeicherte Antworten beziehen sich auf den alten Index, auch wenn die Indexierung
+        # nach dem Löschen fehlschlägt und der Index nun leer oder unvollständig ist
+        if response_cache:
+            response_cache.clear()
+
+    return {
+        "message": f"{chunk_count} Chunks aus {len(pdf_files)} PDFs erfolgreich indexiert"
+    }
+
+
 @main.route('/api/ask', methods=['POST'])
 def ask_question():
     """Frage stellen und Antwort generieren"""
@@ -101,19 +125,17 @@ def ask_question():
 
         question = data['question']
 
-        # OpenAI-Einstellungen
-        openai_api_key = current_app.config['OPENAI_API_KEY']
-        openai_model = current_app.config['OPENAI_MODEL']
-        embedding_model = current_app.config['OPENAI_EMBEDDING_MODEL']
-
-        # Qdrant-Einstellungen
-        qdrant_url = current_app.config['QDRANT_URL']
-        qdrant_api_key = current_app.config['QDRANT_API_KEY']
-        collection_name = current_app.config['QDRANT_COLLECTION_NAME']
+        # Handler der App wiederverwenden
+        handlers = current_app.extensions['handlers']
+        openai_handler = handlers['openai']
+        vector_store = handlers['vector_store']
+        response_cache = handlers['response_cache']
 
-        # Handler initialisieren
-        openai_handler = OpenAIHandler(openai_api_key, openai_model, embedding_model)
-        vector_store = VectorStore(qdrant_url, collection_name, api_key=qdrant_api_key)
+        # Bereits beantwortete Frage direkt aus dem Cache liefern
+        if response_cache:
+            cached_response = response_cache.get(question)
+            if cached_response:
+                return jsonify(cached_response)
 
         # Embedding für die Frage erstellen
         question_embedding = openai_handler.get_embedding(question)
@@ -131,20 +153,26 @@ def ask_question():
         # Antwort generieren
         answer = openai_handler.generate_answer(question, similar_docs)
 
-        # Quellen für die Antwort extrahieren
-        sources = []
+        # Quellen für die Antwort extrahieren (pro Datei nur der beste Treffer, Reihenfolge bleibt erhalten)
+        unique_sources = {}
         for doc in similar_docs:
-            if doc['filename'] not in [s['filename'] for s in sources]:
-                sources.append({
-                    'filename': doc['filename'],
-                    'score': doc['score']
-                })
-
-        return jsonify({
+            if doc.filename not in unique_sources:
+                unique_sources[doc.filename] = {
+                    'filename': doc.filename,
+                    'score': doc.score
+                }
+        sources = list(unique_sources.values())
+
+        response = {
             "success": True,
             "answer": answer,
             "sources": sources
-        })
+        }
+
+        if response_cache:
+            response_cache.set(question, response)
+
+        return jsonify(response)
     except Exception as e:
         logger.error(f"Fehler bei der Beantwortung der Frage: {str(e)}")
         return jsonify({
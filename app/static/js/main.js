@@ -15,7 +15,7 @@ document.addEventListener('DOMContentLoaded', function() {
         indexButton.disabled = true;
         indexStatus.innerHTML = '<div class="alert alert-info">Indexierung gestartet...</div>';
 
-        // API-Anfrage senden
+        // API-Anfrage senden (Indexierung läuft im Hintergrund)
         fetch('/api/index-documents', {
             method: 'POST',
             headers: {
@@ -24,11 +24,18 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
+            // Läuft bereits eine Indexierung, wird deren Status verfolgt (409 mit job_id)
+            if (!data.job_id) {
+                throw new Error(data.message);
+            }
+            return pollIndexingStatus(data.job_id);
+        })
+        .then(job => {
             // Erfolgs- oder Fehlermeldung anzeigen
-            if (data.success) {
-                indexStatus.innerHTML = `<div class="alert alert-success">${data.message}</div>`;
+            if (job.state === 'SUCCESS') {
+                indexStatus.innerHTML = `<div class="alert alert-success">${job.info.message}</div>`;
             } else {
-                indexStatus.innerHTML = `<div class="alert alert-danger">${data.message}</div>`;
+                indexStatus.innerHTML = `<div class="alert alert-danger">${job.info.message}</div>`;
             }
         })
         .catch(error => {
@@ -40,6 +47,25 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Status des Indexierungsauftrags abfragen, bis er abgeschlossen ist
+    function pollIndexingStatus(jobId) {
+        return fetch(`/api/index-documents/${jobId}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.message);
+                }
+                if (data.state === 'SUCCESS' || data.state === 'FAILURE') {
+                    return data;
+                }
+                if (data.info.message) {
+                    indexStatus.innerHTML = `<div class="alert alert-info">${data.info.message}...</div>`;
+                }
+                return new Promise(resolve => setTimeout(resolve, 2000))
+                    .then(() => pollIndexingStatus(jobId));
+            });
+    }
+
     // Event-Listener für das Frageformular
     questionForm.addEventListener('submit', function(event) {
         event.preventDefault();
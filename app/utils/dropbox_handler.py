@@ -1,22 +1,53 @@
+import io
 import os
+import time
 import dropbox
-from dropbox.exceptions import AuthError
+from dropbox.exceptions import AuthError, ApiError
 from flask import current_app as app
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from typing import NamedTuple
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Höchstzahl an Einträgen pro Seite, die Dropbox bei files_list_folder zulässt
+LIST_FOLDER_PAGE_SIZE = 2000
+
+# Blockgröße beim Herunterladen von Dateien
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
+
+class PdfFile(NamedTuple):
+    """PDF-Datei in Dropbox"""
+    path: str
+    name: str
+    id: str
+
+
+class DownloadedPdf(NamedTuple):
+    """PDF-Datei aus Dropbox mit ihrem Inhalt im Speicher"""
+    path: str
+    name: str
+    id: str
+    content: bytes
+
 
 class DropboxHandler:
-    def __init__(self, access_token):
+    def __init__(self, access_token, max_connections=32):
         self.access_token = access_token
+        self.max_connections = max_connections
         self.dbx = self._get_dropbox_client()
 
     def _get_dropbox_client(self):
         """Dropbox-Client erstellen und verbinden"""
         try:
-            dbx = dropbox.Dropbox(self.access_token)
+            # Eine gemeinsame Session mit ausreichend großem Pool, damit parallele Downloads
+            # bestehende Keep-Alive-Verbindungen wiederverwenden statt neue TLS-Handshakes aufzubauen
+            session = dropbox.create_session(max_connections=self.max_connections)
+            dbx = dropbox.Dropbox(self.access_token, session=session)
             dbx.users_get_current_account()
             logger.info("Verbindung zu Dropbox hergestellt")
             return dbx
@@ -24,48 +55,27 @@ class DropboxHandler:
             logger.error("Fehler bei der Authentifizierung mit Dropbox")
             raise
 
-    # In der Datei app/utils/dropbox_handler.py
-    # Die list_pdf_files-Methode anpassen, um mit dem leeren Pfad zu arbeiten:
-
     def list_pdf_files(self, folder_path):
         """Alle PDF-Dateien im angegebenen Ordner und allen Unterordnern auflisten"""
         try:
             files = []
 
-            # Initialer Aufruf mit dem übergebenen Ordnerpfad
-            result = self.dbx.files_list_folder(folder_path)
-
-            # Hilfsfunktion zum Verarbeiten von Einträgen
-            def process_entries(entries):
-                for entry in entries:
-                    if isinstance(entry, dropbox.files.FileMetadata) and entry.name.lower().endswith('.pdf'):
-                        files.append({
-                            'path': entry.path_lower,
-                            'name': entry.name,
-                            'id': entry.id
-                        })
-                    elif isinstance(entry, dropbox.files.FolderMetadata):
-                        # Rekursiv in Unterordner schauen
-                        try:
-                            subresult = self.dbx.files_list_folder(entry.path_lower)
-                            process_entries(subresult.entries)
-
-                            # Weitere Seiten des Unterordners verarbeiten
-                            while subresult.has_more:
-                                subresult = self.dbx.files_list_folder_continue(subresult.cursor)
-                                process_entries(subresult.entries)
-                        except Exception as folder_error:
-                            logger.warning(
-                                f"Fehler beim Durchsuchen des Unterordners {entry.path_lower}: {str(folder_error)}")
-                            continue
-
-            # Erste Seite verarbeiten
-            process_entries(result.entries)
-
-            # Weitere Seiten verarbeiten, falls vorhanden
-            while result.has_more:
+            # Ein rekursiver Aufruf liefert alle Unterordner über denselben Cursor,
+            # statt pro Ordner eine eigene Anfrage zu stellen
+            result = self.dbx.files_list_folder(
+                folder_path,
+                recursive=True,
+                include_non_downloadable_files=False,
+                limit=LIST_FOLDER_PAGE_SIZE
+            )
+
+            while True:
+                files.extend(self._pdf_entries(result.entries))
+
+                # Weitere Seiten verarbeiten, falls vorhanden
+                if not result.has_more:
+                    break
                 result = self.dbx.files_list_folder_continue(result.cursor)
-                process_entries(result.entries)
 
             logger.info(f"{len(files)} PDF-Dateien in {folder_path} und Unterordnern gefunden")
             return files
@@ -73,46 +83,120 @@ class DropboxHandler:
             logger.error(f"Fehler beim Auflisten der PDF-Dateien: {str(e)}")
             raise
 
-    def download_pdf(self, file_path, output_path):
-        """PDF-Datei von Dropbox herunterladen mit Dateinamen-Bereinigung"""
+    def sync_new_pdfs(self, folder_path, cursor_path, timeout=30):
+        """Nur neue oder geänderte PDF-Dateien seit dem letzten Aufruf ermitteln.
+
+        Beim ersten Aufruf wird der komplette Ordner aufgelistet und der Cursor in cursor_path
+        gespeichert. Danach wartet der Aufruf per Longpoll höchstens timeout Sekunden (30-480)
+        auf Änderungen und liefert nur die Deltas. Gelöschte Dateien werden nicht gemeldet.
+        Verlangt Dropbox eine Pause (backoff), wartet der Aufruf diese ab, sodass der Aufrufer direkt
+        erneut aufrufen kann.
+        """
         try:
-            # Dateiname bereinigen - ungültige Zeichen ersetzen
-            # Hier ersetzen wir ungültige Zeichen durch Unterstriche oder andere zulässige Zeichen
-            dir_name = os.path.dirname(output_path)
-            file_name = os.path.basename(output_path)
-
-            # Unzulässige Zeichen für Windows-Dateisystem ersetzen
-            sanitized_name = file_name
-            # Windows verbietet: \ / : * ? " < > |
-            for char in ['\\', '/', ':', '*', '?', '"', '<', '>', '|']:
-                sanitized_name = sanitized_name.replace(char, '_')
-
-            # Sanitized path erstellen
-            sanitized_output_path = os.path.join(dir_name, sanitized_name)
-
-            # Datei herunterladen
-            with open(sanitized_output_path, 'wb') as f:
-                metadata, response = self.dbx.files_download(file_path)
-                f.write(response.content)
-
-            logger.info(f"Datei {file_path} nach {sanitized_output_path} heruntergeladen")
-            return sanitized_output_path
+            cursor = None
+            if os.path.exists(cursor_path):
+                with open(cursor_path, 'r') as f:
+                    cursor = f.read().strip() or None
+
+            result = None
+            if cursor:
+                try:
+                    changes = self.dbx.files_list_folder_longpoll(cursor, timeout=timeout)
+                    if changes.backoff:
+                        # Dropbox verlangt diese Pause vor dem nächsten Longpoll, daher erst danach zurückkehren
+                        logger.info(f"Dropbox bittet um {changes.backoff} Sekunden Pause vor dem nächsten Longpoll")
+                        time.sleep(changes.backoff)
+                    if not changes.changes:
+                        return []
+
+                    result = self.dbx.files_list_folder_continue(cursor)
+                except ApiError as e:
+                    # Abgelaufener Cursor: neu mit vollständiger Auflistung beginnen
+                    if not e.error.is_reset():
+                        raise
+                    logger.warning("Dropbox-Cursor ist ungültig geworden, liste Ordner neu auf")
+
+            if result is None:
+                result = self.dbx.files_list_folder(
+                    folder_path,
+                    recursive=True,
+                    include_non_downloadable_files=False,
+                    limit=LIST_FOLDER_PAGE_SIZE
+                )
+
+            files = []
+            while True:
+                files.extend(self._pdf_entries(result.entries))
+                if not result.has_more:
+                    break
+                result = self.dbx.files_list_folder_continue(result.cursor)
+
+            # Cursor atomar speichern, damit ein Abbruch keinen halben Cursor hinterlässt
+            temp_cursor_path = f"{cursor_path}.tmp"
+            with open(temp_cursor_path, 'w') as f:
+                f.write(result.cursor)
+            os.replace(temp_cursor_path, cursor_path)
+
+            logger.info(f"{len(files)} neue oder geänderte PDF-Dateien in {folder_path} gefunden")
+            return files
+        except Exception as e:
+            logger.error(f"Fehler beim Synchronisieren der PDF-Dateien: {str(e)}")
+            raise
+
+    @staticmethod
+    def _pdf_entries(entries):
+        """PDF-Dateien aus einer Seite von Ordnereinträgen herausfiltern"""
+        return [
+            PdfFile(entry.path_lower, entry.name, entry.id)
+            for entry in entries
+            if isinstance(entry, dropbox.files.FileMetadata) and entry.name[-4:].lower() == '.pdf'
+        ]
+
+    def download_pdf_bytes(self, file_path):
+        """PDF-Datei von Dropbox direkt in den Speicher laden, ohne Umweg über die Festplatte"""
+        try:
+            metadata, response = self.dbx.files_download(file_path)
+
+            # In Blöcken in einen Puffer lesen: response.content sammelt erst alle Blöcke und fügt sie dann
+            # zu einer Kopie zusammen, getvalue() übergibt den Puffer dagegen ohne weitere Kopie
+            buffer = io.BytesIO()
+            with closing(response):
+                for block in response.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE):
+                    buffer.write(block)
+            content = buffer.getvalue()
+
+            logger.info(f"Datei {file_path} heruntergeladen ({len(content)} Bytes)")
+            return content
         except Exception as e:
             logger.error(f"Fehler beim Herunterladen der Datei {file_path}: {str(e)}")
             raise
 
-    def download_all_pdfs(self, folder_path, output_folder):
-        """Alle PDF-Dateien aus einem Dropbox-Ordner herunterladen"""
-        pdf_files = self.list_pdf_files(folder_path)
-        downloaded_paths = []
-
-        for pdf in pdf_files:
-            try:
-                output_path = os.path.join(output_folder, pdf['name'])
-                downloaded_path = self.download_pdf(pdf['path'], output_path)
-                downloaded_paths.append(downloaded_path)
-            except Exception as e:
-                logger.error(f"Fehler beim Herunterladen von {pdf['path']}, überspringe Datei: {str(e)}")
-                continue
-
-        return downloaded_paths
\ No newline at end of file
+    def iter_pdf_bytes(self, pdf_files, max_workers=16):
+        """PDF-Dateien parallel in den Speicher laden und in Eingabereihenfolge liefern.
+        Es laufen höchstens max_workers Downloads voraus, damit nie der gesamte Bestand im Speicher liegt."""
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for pdf in pdf_files:
+                pending.append((pdf, executor.submit(self.download_pdf_bytes, pdf.path)))
+                if len(pending) >= max_workers:
+                    downloaded = self._downloaded_pdf(*pending.popleft())
+                    if downloaded:
+                        yield downloaded
+
+            while pending:
+                downloaded = self._downloaded_pdf(*pending.popleft())
+                if downloaded:
+                    yield downloaded
+        finally:
+            # Bei einem Abbruch noch nicht begonnene Downloads verwerfen
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _downloaded_pdf(pdf, future):
+        """Ergebnis eines Downloads abholen, bei Fehlern wird die Datei übersprungen"""
+        try:
+            return DownloadedPdf(*pdf, content=future.result())
+        except Exception as e:
+            logger.error(f"Fehler beim Herunterladen von {pdf.path}, überspringe Datei: {str(e)}")
+            return None
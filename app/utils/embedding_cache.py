@@ -0,0 +1,57 @@
+import hashlib
+import sqlite3
+import threading
+import logging
+from typing import List, Optional
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Embeddings nach Inhalt und Modell in SQLite speichern, damit unveränderte Chunks nicht erneut angefragt werden"""
+
+    # SQLite erlaubt nur eine begrenzte Anzahl an Parametern pro Abfrage
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def _make_key(self, text: str) -> bytes:
+        """Schlüssel aus Modellname und Chunk-Text bilden"""
+        return hashlib.blake2b(f"{self.model}:{text}".encode(), digest_size=16).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Gespeicherte Embeddings in Eingabereihenfolge abrufen, None für nicht vorhandene Texte"""
+        keys = [self._make_key(text) for text in texts]
+        found = {}
+        try:
+            with self._lock:
+                for start in range(0, len(keys), self.LOOKUP_BATCH_SIZE):
+                    batch_keys = keys[start:start + self.LOOKUP_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch_keys))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch_keys
+                    )
+                    found.update(rows)
+        except Exception as e:
+            logger.warning(f"Fehler beim Lesen aus dem Embedding-Cache: {str(e)}")
+
+        return [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+
+    def set_many(self, texts: List[str], vectors: np.ndarray):
+        """Neue Embeddings speichern"""
+        try:
+            rows = [(self._make_key(text), np.asarray(vector, dtype=np.float32).tobytes())
+                    for text, vector in zip(texts, vectors)]
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        except Exception as e:
+            logger.warning(f"Fehler beim Schreiben in den Embedding-Cache: {str(e)}")
@@ -0,0 +1,80 @@
+import threading
+import logging
+from app.utils.dropbox_handler import DropboxHandler
+from app.utils.pdf_processor import OCRDocumentProcessor
+from app.utils.vector_store import VectorStore
+from app.utils.openai_handler import OpenAIHandler
+from app.utils.response_cache import ResponseCache
+from app.utils.embedding_cache import EmbeddingCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class HandlerRegistry:
+    """Handler einmal pro App erstellen und über alle Requests hinweg wiederverwenden"""
+
+    def __init__(self, config):
+        self.config = config
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._factories = {
+            'dropbox': self._create_dropbox_handler,
+            'pdf_processor': self._create_pdf_processor,
+            'vector_store': self._create_vector_store,
+            'openai': self._create_openai_handler,
+            'response_cache': self._create_response_cache,
+        }
+
+    def __getitem__(self, name):
+        """Handler beim ersten Zugriff erstellen, danach die bestehende Instanz liefern"""
+        if name in self._handlers:
+            return self._handlers[name]
+
+        with self._lock:
+            # Erneut prüfen, ein anderer Thread könnte den Handler inzwischen erstellt haben
+            if name not in self._handlers:
+                self._handlers[name] = self._factories[name]()
+                logger.info(f"Handler '{name}' initialisiert")
+            return self._handlers[name]
+
+    def _create_dropbox_handler(self):
+        return DropboxHandler(self.config['DROPBOX_ACCESS_TOKEN'])
+
+    def _create_pdf_processor(self):
+        return OCRDocumentProcessor(self.config['CHUNK_SIZE'], self.config['CHUNK_OVERLAP'])
+
+    def _create_vector_store(self):
+        return VectorStore(
+            self.config['QDRANT_URL'],
+            self.config['QDRANT_COLLECTION_NAME'],
+            api_key=self.config['QDRANT_API_KEY'],
+            prefer_grpc=self.config['QDRANT_PREFER_GRPC'],
+            grpc_port=self.config['QDRANT_GRPC_PORT'],
+            on_disk=self.config['QDRANT_ON_DISK']
+        )
+
+    def _create_openai_handler(self):
+        # Ohne Pfad werden Embeddings bei jeder Indexierung neu angefragt
+        embedding_cache = None
+        if self.config['EMBEDDING_CACHE_PATH']:
+            embedding_cache = EmbeddingCache(self.config['EMBEDDING_CACHE_PATH'], self.config['OPENAI_EMBEDDING_MODEL'])
+
+        return OpenAIHandler(
+            self.config['OPENAI_API_KEY'],
+            self.config['OPENAI_MODEL'],
+            self.config['OPENAI_EMBEDDING_MODEL'],
+            max_concurrent_requests=self.config['OPENAI_MAX_CONCURRENT_REQUESTS'],
+            max_retries=self.config['OPENAI_MAX_RETRIES'],
+            embedding_cache=embedding_cache
+        )
+
+    def _create_response_cache(self):
+        # Ohne Redis-URL bleibt der Cache deaktiviert
+        if not self.config['REDIS_URL']:
+            return None
+        return ResponseCache(
+            self.config['REDIS_URL'],
+            namespace=f"{self.config['OPENAI_MODEL']}:{self.config['OPENAI_EMBEDDING_MODEL']}",
+            expiration_seconds=self.config['CACHE_EXPIRATION_SECONDS']
+        )
@@ -0,0 +1,69 @@
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class IndexingJobManager:
+    """Indexierungsläufe im Hintergrund ausführen und ihren Status für die API bereitstellen"""
+
+    # Nur abgeschlossene Aufträge dürfen aus der Liste entfernt werden
+    FINISHED_STATES = ("SUCCESS", "FAILURE")
+
+    def __init__(self, max_workers=1, max_jobs=20):
+        # Ein Worker: jeder Lauf setzt die Collection zurück, parallele Läufe würden sich stören
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="indexing")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def submit(self, func, *args, **kwargs) -> Tuple[str, bool]:
+        """Auftrag einreihen; func erhält als erstes Argument eine Funktion zum Melden des Fortschritts.
+        Läuft bereits ein Auftrag oder wartet einer, wird kein neuer eingereiht, sondern (job_id, False)
+        für den bestehenden Auftrag geliefert, da jeder Lauf den Index komplett neu aufbaut."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job["state"] not in self.FINISHED_STATES:
+                    return job["job_id"], False
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"job_id": job_id, "state": "PENDING", "info": {}}
+
+            # Nur die letzten abgeschlossenen Aufträge aufbewahren, laufende bleiben abfragbar
+            finished_ids = [job["job_id"] for job in self._jobs.values() if job["state"] in self.FINISHED_STATES]
+            for finished_id in finished_ids[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[finished_id]
+
+        self._executor.submit(self._run, job_id, func, *args, **kwargs)
+        logger.info(f"Indexierungsauftrag {job_id} eingereiht")
+        return job_id, True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Aktuellen Status eines Auftrags abrufen"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return {**job, "info": dict(job["info"])} if job else None
+
+    def _update(self, job_id: str, state: str = None, **info):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if state:
+                job["state"] = state
+            job["info"].update(info)
+
+    def _run(self, job_id: str, func, *args, **kwargs):
+        self._update(job_id, state="STARTED")
+        try:
+            result = func(partial(self._update, job_id), *args, **kwargs)
+            self._update(job_id, state="SUCCESS", **(result or {}))
+        except Exception as e:
+            logger.error(f"Fehler im Indexierungsauftrag {job_id}: {str(e)}")
+            self._update(job_id, state="FAILURE", message=str(e))
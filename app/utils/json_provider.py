@@ -0,0 +1,17 @@
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON-Provider für Flask auf Basis von orjson (schnellere Kodierung von Antworten und Requests)"""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
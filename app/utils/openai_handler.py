@@ -1,20 +1,46 @@
 import os
+import re
 import openai
-from typing import List, Dict, Any
+import httpx
+from typing import List, Dict, Any, Iterator, Tuple, TYPE_CHECKING
 import logging
 import tiktoken
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+if TYPE_CHECKING:
+    # Nur für Typannotationen, damit der Handler zur Laufzeit nicht von qdrant_client abhängt
+    from app.utils.vector_store import SimilarDoc
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Trennzeichen zwischen den Absätzen des Kontexts
+PARAGRAPH_SEPARATOR = re.compile(r'\n\n')
+
 
 class OpenAIHandler:
-    def __init__(self, api_key, model="gpt-3.5-turbo", embedding_model="text-embedding-ada-002"):
+    def __init__(self, api_key, model="gpt-3.5-turbo", embedding_model="text-embedding-ada-002",
+                 max_concurrent_requests=5, max_retries=5, embedding_cache=None):
         self.api_key = api_key
-        self.client = openai.OpenAI(api_key=api_key)
+        # Der Client wiederholt Anfragen bei 429/5xx mit exponentiellem Backoff und beachtet Retry-After.
+        # Ein gemeinsamer HTTP/2-Connection-Pool vermeidet neue TLS-Handshakes pro Anfrage.
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            max_retries=max_retries,
+            http_client=openai.DefaultHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+            )
+        )
         self.model = model
         self.embedding_model = embedding_model
+        self.max_concurrent_requests = max_concurrent_requests
         self.encoding = tiktoken.encoding_for_model(model)
+        self.embedding_encoding = tiktoken.encoding_for_model(embedding_model)
+        # Optionaler EmbeddingCache, damit unveränderte Chunks nicht erneut angefragt werden
+        self.embedding_cache = embedding_cache
 
     def get_embedding(self, text: str) -> List[float]:
         """Text-Embedding mit OpenAI erstellen"""
@@ -30,44 +56,147 @@ class OpenAIHandler:
             logger.error(f"Fehler beim Erstellen des Embeddings: {str(e)}")
             raise
 
-    def get_embeddings_batch(self, texts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Batch-Verarbeitung für Embeddings mehrerer Texte"""
+    def get_embeddings_batch(self, chunks: List[Dict[str, Any]], batch_size: int = 2048,
+                             max_batch_tokens: int = 250000) -> np.ndarray:
+        """Batch-Verarbeitung für Embeddings mehrerer Texte, Ergebnis als float32-Matrix in Eingabereihenfolge"""
         try:
-            result_with_embeddings = []
-
-            # Verarbeite in Batches von 20 (OpenAI-Empfehlung)
-            batch_size = 20
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                text_batch = [item["chunk_text"] for item in batch]
-
-                response = self.client.embeddings.create(
-                    model=self.embedding_model,
-                    input=text_batch
-                )
-
-                # Füge Embeddings zu den ursprünglichen Daten hinzu
-                for j, embedding_data in enumerate(response.data):
-                    item_with_embedding = batch[j].copy()
-                    item_with_embedding["embedding"] = embedding_data.embedding
-                    result_with_embeddings.append(item_with_embedding)
-
-            logger.info(f"Embeddings für {len(result_with_embeddings)} Texte erstellt")
-            return result_with_embeddings
+            if not chunks:
+                return np.empty((0, 0), dtype=np.float32)
+
+            # Identische Texte (z.B. Kopfzeilen oder Hinweise in vielen PDFs) nur einmal einbetten
+            unique_positions = {}
+            positions = [unique_positions.setdefault(chunk["chunk_text"], len(unique_positions)) for chunk in chunks]
+            unique_texts = list(unique_positions)
+
+            embeddings = self._get_unique_embeddings(unique_texts, batch_size, max_batch_tokens)
+            if len(unique_texts) == len(chunks):
+                return embeddings
+
+            logger.info(f"{len(chunks) - len(unique_texts)} doppelte Chunks wurden nur einmal eingebettet")
+            return embeddings[positions]
         except Exception as e:
             logger.error(f"Fehler beim Erstellen von Batch-Embeddings: {str(e)}")
             raise
 
+    def _get_unique_embeddings(self, texts: List[str], batch_size: int, max_batch_tokens: int) -> np.ndarray:
+        """Embeddings aus dem Cache laden und nur fehlende Texte bei OpenAI anfragen"""
+        if self.embedding_cache is None:
+            return self._embed_texts(texts, batch_size, max_batch_tokens)
+
+        # Nur Texte anfragen, deren Embedding noch nicht im Cache liegt
+        cached = self.embedding_cache.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        logger.info(f"{len(texts) - len(missing)} von {len(texts)} Embeddings aus dem Cache geladen")
+
+        if not missing:
+            return np.vstack(cached)
+
+        missing_texts = [texts[i] for i in missing]
+        new_embeddings = self._embed_texts(missing_texts, batch_size, max_batch_tokens)
+        self.embedding_cache.set_many(missing_texts, new_embeddings)
+
+        embeddings = np.empty((len(texts), new_embeddings.shape[1]), dtype=np.float32)
+        for i, vector in enumerate(cached):
+            if vector is not None:
+                embeddings[i] = vector
+        embeddings[missing] = new_embeddings
+        return embeddings
+
+    def _embed_texts(self, texts: List[str], batch_size: int, max_batch_tokens: int) -> np.ndarray:
+        """Embeddings für alle Texte über mehrere gleichzeitige Requests abrufen"""
+        # Möglichst große Batches senden (OpenAI-Limit: 2048 Texte bzw. 300k Tokens pro Request)
+        batches = self._split_batches(texts, batch_size, max_batch_tokens)
+
+        embeddings = None
+        row = 0
+
+        # Mehrere Batches gleichzeitig anfragen, map() liefert die Ergebnisse in Eingabereihenfolge
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            for batch_embeddings in executor.map(self._embed_batch, batches):
+                # Matrix erst anlegen, wenn die Dimension des Modells bekannt ist
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), len(batch_embeddings[0])), dtype=np.float32)
+                embeddings[row:row + len(batch_embeddings)] = batch_embeddings
+                row += len(batch_embeddings)
+
+        logger.info(f"Embeddings für {len(embeddings)} Texte erstellt")
+        return embeddings
+
+    def _embed_batch(self, batch_texts: List[str]) -> List[List[float]]:
+        """Embeddings für einen einzelnen Batch mit einem Request abrufen"""
+        response = self.client.embeddings.create(
+            model=self.embedding_model,
+            input=batch_texts
+        )
+        return [embedding_data.embedding for embedding_data in response.data]
+
+    def _split_batches(self, texts: List[str], batch_size: int, max_batch_tokens: int) -> List[List[str]]:
+        """Texte in einem Durchlauf in Batches aufteilen, die weder die Anzahl- noch die Token-Grenze überschreiten"""
+        # encode_batch tokenisiert alle Texte parallel in Rust (ohne GIL)
+        token_counts = [len(tokens) for tokens in self.embedding_encoding.encode_batch(texts, disallowed_special=())]
+
+        batches = []
+        current_batch = []
+        current_tokens = 0
+
+        for chunk_text, chunk_tokens in zip(texts, token_counts):
+            if current_batch and (len(current_batch) >= batch_size
+                                  or current_tokens + chunk_tokens > max_batch_tokens):
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+
+            current_batch.append(chunk_text)
+            current_tokens += chunk_tokens
+
+        if current_batch:
+            batches.append(current_batch)
+
+        return batches
+
     def num_tokens(self, text: str) -> int:
         """Anzahl der Tokens in einem Text berechnen"""
-        tokens = self.encoding.encode(text)
-        return len(tokens)
-
-    def generate_answer(self, query: str, context_texts: List[Dict[str, Any]]) -> str:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def num_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Anzahl der Tokens für mehrere Texte in einem Aufruf berechnen"""
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())]
+
+    def _trim_context(self, context: str, max_tokens: int, window_size: int = 64) -> str:
+        """Kontext auf ganze Absätze innerhalb des Token-Budgets kürzen.
+        Absätze werden fensterweise tokenisiert, sobald das Budget überschritten ist, wird abgebrochen."""
+        paragraph_spans = self._paragraph_spans(context)
+        used_tokens = 0
+        kept_end = 0
+
+        while True:
+            window = list(islice(paragraph_spans, window_size))
+            if not window:
+                break
+
+            token_counts = self.num_tokens_batch([context[start:end] for start, end in window])
+            for (start, end), paragraph_tokens in zip(window, token_counts):
+                used_tokens += paragraph_tokens
+                if used_tokens > max_tokens:
+                    return context[:kept_end]
+                kept_end = end
+
+        return context[:kept_end]
+
+    @staticmethod
+    def _paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+        """(Start, Ende) der durch Leerzeilen getrennten Absätze nacheinander liefern"""
+        start = 0
+        for separator in PARAGRAPH_SEPARATOR.finditer(text):
+            yield start, separator.start()
+            start = separator.end()
+        yield start, len(text)
+
+    def generate_answer(self, query: str, context_texts: List['SimilarDoc']) -> str:
         """Antwort basierend auf dem Kontext und der Frage generieren"""
         try:
             # Kontext aus den gefundenen relevanten Dokumenten erstellen
-            context = "\n\n".join([f"Aus {doc['filename']}: {doc['chunk_text']}" for doc in context_texts])
+            context = "\n\n".join([f"Aus {doc.filename}: {doc.chunk_text}" for doc in context_texts])
 
             # System-Prompt, der das Modell einschränkt, nur auf den bereitgestellten Kontext zurückzugreifen
             system_prompt = """
@@ -84,23 +213,11 @@ class OpenAIHandler:
             max_context_tokens = 15000 - system_tokens - query_tokens - 100  # Sicherheitspuffer
 
             # Kürze Kontext bei Bedarf
-            if self.num_tokens(context) > max_context_tokens:
+            context_tokens = self.num_tokens(context)
+            if context_tokens > max_context_tokens:
                 logger.warning(
-                    f"Kontext zu groß, wird gekürzt von {self.num_tokens(context)} auf ~{max_context_tokens} Tokens")
-                # Teile den Kontext nach Absätzen
-                paragraphs = context.split("\n\n")
-                shortened_context = ""
-                current_tokens = 0
-
-                for para in paragraphs:
-                    para_tokens = self.num_tokens(para)
-                    if current_tokens + para_tokens <= max_context_tokens:
-                        shortened_context += para + "\n\n"
-                        current_tokens += para_tokens
-                    else:
-                        break
-
-                context = shortened_context
+                    f"Kontext zu groß, wird gekürzt von {context_tokens} auf ~{max_context_tokens} Tokens")
+                context = self._trim_context(context, max_context_tokens)
 
             # Erstelle die Nachricht für den API-Aufruf
             messages = [
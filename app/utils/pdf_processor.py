@@ -1,173 +1,269 @@
 import os
+import io
 import PyPDF2
+import pypdfium2 as pdfium
 import re
 import logging
-from typing import List, Dict, Any
+import multiprocessing
+from typing import List, Dict, Any, Iterable, Iterator
 import pytesseract
-from pdf2image import convert_from_path
-import tempfile
+from pdf2image import convert_from_bytes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Nicht-leere Zeilen eines Textes, wird beim Chunking schrittweise durchlaufen
+LINE_PATTERN = re.compile(r'[^\n]+')
+
+# Muster für semantische Trennung (Abschnitte, Paragraphen, etc.), zu einem Ausdruck zusammengefasst
+SECTION_PATTERN = re.compile('|'.join([
+    r'§\s*\d+[a-z]?\.?\s+[A-Z]',  # Paragraphen in Verträgen, z.B. "§ 1. Vertragsgegenstand"
+    r'^\s*\d+\.\s+[A-Z]',  # Nummerierte Abschnitte, z.B. "1. Allgemeines"
+    r'--- Seite \d+ ---',  # Seitenmarkierungen
+    r'^[A-Z][A-Za-zÄÖÜäöüß\s]{3,}$'  # Überschriften (komplett großgeschrieben)
+]))
+
+# Worker-Prozesse frisch starten statt zu forken: der Pool wird aus dem Indexierungs-Thread eines Prozesses
+# erzeugt, in dem bereits gRPC-, httpx- und Logging-Threads laufen, deren Locks ein Fork mitkopieren würde
+POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _init_worker(tesseract_cmd: str):
+    """Tesseract-Pfad im Worker-Prozess setzen (das Modul wird dort neu importiert)"""
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
 
 class OCRDocumentProcessor:
-    def __init__(self, chunk_size=1000, chunk_overlap=200):
+    def __init__(self, chunk_size=1000, chunk_overlap=200, ocr_workers=None, pdf_workers=None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        cpu_count = os.cpu_count() or 1
+        # Anzahl der Prozesse, auf die mehrere PDFs verteilt werden
+        self.pdf_workers = pdf_workers or cpu_count
+        # Anzahl gleichzeitig laufender Tesseract-Prozesse pro Worker-Prozess. Die CPUs werden auf beide
+        # Ebenen aufgeteilt, sonst liefen pdf_workers * ocr_workers Tesseract-Prozesse gleichzeitig
+        self.ocr_workers = ocr_workers or max(1, min(8, cpu_count // self.pdf_workers))
 
         pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Text aus einer PDF-Datei extrahieren mit OCR-Fallback"""
+    def extract_text_from_pdf_bytes(self, pdf_data: bytes, name: str) -> str:
+        """Text aus einer PDF im Speicher extrahieren mit OCR-Fallback"""
         try:
-            # Erst versuchen wir es mit PyPDF2 für digitalen Text
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"--- Seite {page_num + 1} ---\n{page_text}\n\n"
+            # Erst versuchen wir es mit PDFium für digitalen Text, PyPDF2 nur als Ausweichlösung
+            try:
+                text = self._extract_text_with_pdfium(pdf_data)
+            except Exception as e:
+                logger.warning(f"PDFium konnte {name} nicht lesen, versuche PyPDF2: {str(e)}")
+                text = self._extract_text_with_pypdf2(pdf_data)
 
             # Wenn kein Text gefunden wurde oder dieser sehr kurz ist, OCR anwenden
             if len(text.strip()) < 100:  # Annahme: Wenn weniger als 100 Zeichen, dann wahrscheinlich kein digitaler Text
-                logger.info(f"Wenig oder kein Text mit PyPDF2 gefunden. Versuche OCR für {pdf_path}")
-                text = self._extract_text_with_ocr(pdf_path)
+                logger.info(f"Wenig oder kein digitaler Text gefunden. Versuche OCR für {name}")
+                text = self._extract_text_with_ocr(pdf_data, name)
 
-            logger.info(f"Text aus {pdf_path} extrahiert")
+            logger.info(f"Text aus {name} extrahiert")
             return text
         except Exception as e:
-            logger.error(f"Fehler beim Extrahieren des Textes aus {pdf_path}: {str(e)}")
+            logger.error(f"Fehler beim Extrahieren des Textes aus {name}: {str(e)}")
             logger.info("Versuche OCR als Fallback...")
             try:
-                return self._extract_text_with_ocr(pdf_path)
+                return self._extract_text_with_ocr(pdf_data, name)
             except Exception as ocr_e:
                 logger.error(f"Auch OCR ist fehlgeschlagen: {str(ocr_e)}")
                 raise
 
-    def _extract_text_with_ocr(self, pdf_path: str) -> str:
-        """Text aus PDF mit OCR extrahieren"""
+    def _extract_text_with_pdfium(self, pdf_data: bytes) -> str:
+        """Digitalen Text mit PDFium (C++) extrahieren"""
+        pdf = pdfium.PdfDocument(pdf_data)
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # PDF in Bilder konvertieren
-                images = convert_from_path(pdf_path, dpi=300)  # Höhere Auflösung für bessere OCR
+            text_parts = []
+            for page_num in range(len(pdf)):
+                page = pdf[page_num]
+                try:
+                    text_page = page.get_textpage()
+                    try:
+                        page_text = text_page.get_text_bounded()
+                    finally:
+                        text_page.close()
+                finally:
+                    page.close()
 
-                full_text = ""
-                for i, image in enumerate(images):
-                    # Bild temporär speichern
-                    temp_image = os.path.join(temp_dir, f'page_{i}.png')
-                    image.save(temp_image, 'PNG')
+                if page_text:
+                    text_parts.append(f"--- Seite {page_num + 1} ---\n{page_text}\n\n")
 
-                    # OCR auf dem Bild ausführen (für deutsche Dokumente)
-                    try:
-                        page_text = pytesseract.image_to_string(temp_image, lang='deu')
-                    except:
-                        # Fallback auf Englisch, falls deutsches Sprachpaket nicht installiert ist
-                        page_text = pytesseract.image_to_string(temp_image, lang='eng')
+            return "".join(text_parts)
+        finally:
+            pdf.close()
+
+    def _extract_text_with_pypdf2(self, pdf_data: bytes) -> str:
+        """Digitalen Text mit PyPDF2 extrahieren (langsamer, nur als Ausweichlösung)"""
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+        text = ""
 
-                    full_text += f"--- Seite {i + 1} ---\n{page_text}\n\n"
+        for page_num in range(len(reader.pages)):
+            page = reader.pages[page_num]
+            page_text = page.extract_text()
+            if page_text:
+                text += f"--- Seite {page_num + 1} ---\n{page_text}\n\n"
 
-                logger.info(f"OCR-Text aus {pdf_path} extrahiert")
-                return full_text
+        return text
+
+    def _extract_text_with_ocr(self, pdf_data: bytes, name: str) -> str:
+        """Text aus PDF mit OCR extrahieren"""
+        try:
+            # PDF in Graustufenbilder konvertieren (200 dpi reichen Tesseract, mehr kostet nur Rechenzeit).
+            # pdftoppm erhält nur den CPU-Anteil dieses Worker-Prozesses, die übrigen CPUs rendern andere PDFs
+            images = convert_from_bytes(pdf_data, dpi=200, grayscale=True, thread_count=self.ocr_workers)
+
+            # Tesseract läuft pro Seite als eigener Prozess, daher mehrere Seiten parallel erkennen
+            with ThreadPoolExecutor(max_workers=self.ocr_workers) as executor:
+                page_texts = executor.map(self._ocr_page, images)
+                full_text = "".join(
+                    f"--- Seite {i + 1} ---\n{page_text}\n\n" for i, page_text in enumerate(page_texts)
+                )
+
+            logger.info(f"OCR-Text aus {name} extrahiert")
+            return full_text
         except Exception as e:
-            logger.error(f"Fehler bei der OCR-Textextraktion aus {pdf_path}: {str(e)}")
+            logger.error(f"Fehler bei der OCR-Textextraktion aus {name}: {str(e)}")
             raise
 
+    def _ocr_page(self, image) -> str:
+        """OCR für eine einzelne Seite ausführen, das Bild wird direkt an pytesseract übergeben"""
+        # OCR auf dem Bild ausführen (für deutsche Dokumente)
+        try:
+            return pytesseract.image_to_string(image, lang='deu')
+        except Exception:
+            # Fallback auf Englisch, falls deutsches Sprachpaket nicht installiert ist
+            return pytesseract.image_to_string(image, lang='eng')
+
     def chunk_text(self, text: str, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Text in semantisch sinnvolle Chunks aufteilen"""
-        # Definiere Muster für semantische Trennung (Abschnitte, Paragraphen, etc.)
-        section_patterns = [
-            r'§\s*\d+[a-z]?\.?\s+[A-Z]',  # Paragraphen in Verträgen, z.B. "§ 1. Vertragsgegenstand"
-            r'^\s*\d+\.\s+[A-Z]',  # Nummerierte Abschnitte, z.B. "1. Allgemeines"
-            r'--- Seite \d+ ---',  # Seitenmarkierungen
-            r'^[A-Z][A-Za-zÄÖÜäöüß\s]{3,}$'  # Überschriften (komplett großgeschrieben)
-        ]
-
-        # Textblöcke durch semantische Muster teilen
-        chunks = []
-        current_chunk = ""
+        # Textblöcke durch semantische Muster teilen, zunächst nur als (Abschnitt, Text)
+        section_chunks = []
+        # Zeilen sammeln und erst beim Abschließen eines Chunks zusammenfügen
+        current_parts = []
+        current_length = 0
         current_section = "Allgemein"
 
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
+        # Zeilen einzeln aus dem Text lesen statt vorher eine komplette Zeilenliste anzulegen
+        for line_match in LINE_PATTERN.finditer(text):
+            line = line_match.group().strip()
             if not line:
                 continue
 
             # Prüfen, ob die Zeile ein neuer Abschnitt ist
-            is_new_section = False
-            for pattern in section_patterns:
-                if re.match(pattern, line):
-                    # Speichere den aktuellen Chunk, wenn er nicht leer ist
-                    if current_chunk.strip():
-                        chunk_metadata = metadata.copy()
-                        chunk_metadata["section"] = current_section
-                        chunk_metadata["chunk_text"] = current_chunk.strip()
-                        chunks.append(chunk_metadata)
-
-                    # Beginne einen neuen Chunk mit der aktuellen Zeile als Überschrift
-                    current_section = line
-                    current_chunk = line + "\n"
-                    is_new_section = True
-                    break
-
-            if not is_new_section:
+            if SECTION_PATTERN.match(line):
+                # Speichere den aktuellen Chunk, wenn er nicht leer ist
+                current_chunk = "".join(current_parts).strip()
+                if current_chunk:
+                    section_chunks.append((current_section, current_chunk))
+
+                # Beginne einen neuen Chunk mit der aktuellen Zeile als Überschrift
+                current_section = line
+                current_parts = [line, "\n"]
+                current_length = len(line) + 1
+            else:
                 # Füge die Zeile zum aktuellen Chunk hinzu
-                current_chunk += line + "\n"
+                current_parts.append(line)
+                current_parts.append("\n")
+                current_length += len(line) + 1
 
                 # Wenn der aktuelle Chunk zu groß wird, teile ihn auf
-                if len(current_chunk) > self.chunk_size:
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata["section"] = current_section
-                    chunk_metadata["chunk_text"] = current_chunk[:self.chunk_size].strip()
-                    chunks.append(chunk_metadata)
+                if current_length > self.chunk_size:
+                    current_chunk = "".join(current_parts)
+                    section_chunks.append((current_section, current_chunk[:self.chunk_size].strip()))
 
                     # Überlappung für den nächsten Chunk
                     overlap_start = max(0, self.chunk_size - self.chunk_overlap)
-                    current_chunk = current_chunk[overlap_start:]
+                    overlap = current_chunk[overlap_start:]
+                    current_parts = [overlap]
+                    current_length = len(overlap)
 
         # Letzten Chunk hinzufügen
-        if current_chunk.strip():
-            chunk_metadata = metadata.copy()
-            chunk_metadata["section"] = current_section
-            chunk_metadata["chunk_text"] = current_chunk.strip()
-            chunks.append(chunk_metadata)
+        current_chunk = "".join(current_parts).strip()
+        if current_chunk:
+            section_chunks.append((current_section, current_chunk))
+
+        # Metadaten erst am Ende in einem Durchlauf anhängen
+        chunks = [
+            {**metadata, "section": section, "chunk_text": chunk_text}
+            for section, chunk_text in section_chunks
+        ]
 
         logger.info(f"Text in {len(chunks)} semantische Chunks aufgeteilt")
         return chunks
 
-    def process_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
-        """PDF-Datei vollständig verarbeiten: Text extrahieren und in Chunks aufteilen"""
+    def process_pdf_bytes(self, pdf_data: bytes, filename: str, source: str) -> List[Dict[str, Any]]:
+        """PDF im Speicher vollständig verarbeiten: Text extrahieren und in Chunks aufteilen"""
         try:
-            filename = os.path.basename(pdf_path)
-            text = self.extract_text_from_pdf(pdf_path)
+            text = self.extract_text_from_pdf_bytes(pdf_data, source)
 
             metadata = {
-                "source": pdf_path,
+                "source": source,
                 "filename": filename
             }
 
             chunks = self.chunk_text(text, metadata)
             return chunks
         except Exception as e:
-            logger.error(f"Fehler bei der Verarbeitung von {pdf_path}: {str(e)}")
+            logger.error(f"Fehler bei der Verarbeitung von {source}: {str(e)}")
             raise
 
-    def process_multiple_pdfs(self, pdf_paths: List[str]) -> List[Dict[str, Any]]:
-        """Mehrere PDF-Dateien verarbeiten"""
-        all_chunks = []
+    def iter_chunk_batches(self, pdf_files: Iterable[Any], batch_size: int = 8192) -> Iterator[List[Dict[str, Any]]]:
+        """PDFs im Speicher parallel verarbeiten und die Chunks in Gruppen von mindestens batch_size liefern,
+        damit die Gruppen weiterverarbeitet werden können, während die Worker noch weitere PDFs lesen"""
+        batch = []
+        total_chunks = 0
+        pdf_count = 0
 
-        for pdf_path in pdf_paths:
-            try:
-                chunks = self.process_pdf(pdf_path)
-                all_chunks.extend(chunks)
-                logger.info(f"PDF {pdf_path} erfolgreich verarbeitet, {len(chunks)} Chunks extrahiert")
-            except Exception as e:
-                logger.error(f"Fehler bei der Verarbeitung von {pdf_path}, überspringe Datei: {str(e)}")
-                continue
+        for chunks in self._iter_in_pool(pdf_files):
+            pdf_count += 1
+            batch.extend(chunks)
+            if len(batch) >= batch_size:
+                total_chunks += len(batch)
+                yield batch
+                batch = []
 
-        logger.info(f"Insgesamt {len(all_chunks)} Chunks aus {len(pdf_paths)} PDFs extrahiert")
-        return all_chunks
\ No newline at end of file
+        if batch:
+            total_chunks += len(batch)
+            yield batch
+
+        logger.info(f"Insgesamt {total_chunks} Chunks aus {pdf_count} PDFs extrahiert")
+
+    def _iter_in_pool(self, pdf_files: Iterable[Any]) -> Iterator[List[Dict[str, Any]]]:
+        """Textextraktion und OCR sind CPU-lastig, daher auf mehrere Prozesse verteilen.
+        Liefert die Chunks pro Datei in Eingabereihenfolge, sobald sie verfügbar sind. Es werden höchstens
+        doppelt so viele PDFs eingereicht, wie Worker laufen, damit sich PDF-Inhalte und fertige Ergebnisse
+        nicht im Speicher stauen, während die Embeddings erstellt werden."""
+        max_pending = self.pdf_workers * 2
+        pending = deque()
+
+        executor = ProcessPoolExecutor(max_workers=self.pdf_workers,
+                                       mp_context=POOL_CONTEXT,
+                                       initializer=_init_worker,
+                                       initargs=(pytesseract.pytesseract.tesseract_cmd,))
+        try:
+            for pdf in pdf_files:
+                pending.append(executor.submit(self._try_process_pdf_bytes, pdf))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Bei einem Abbruch (z.B. Fehler beim Speichern) noch nicht begonnene PDFs verwerfen,
+            # statt auf die OCR aller eingereichten Dateien zu warten
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _try_process_pdf_bytes(self, pdf) -> List[Dict[str, Any]]:
+        """Eine PDF im Speicher verarbeiten, bei Fehlern wird die Datei übersprungen"""
+        try:
+            chunks = self.process_pdf_bytes(pdf.content, pdf.name, pdf.path)
+            logger.info(f"PDF {pdf.path} erfolgreich verarbeitet, {len(chunks)} Chunks extrahiert")
+            return chunks
+        except Exception as e:
+            logger.error(f"Fehler bei der Verarbeitung von {pdf.path}, überspringe Datei: {str(e)}")
+            return []
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+import redis
+import orjson
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Antworten in Redis zwischenspeichern, damit alle Worker denselben Cache mit TTL nutzen"""
+
+    KEY_PREFIX = "pdf-assistant:answer:"
+
+    def __init__(self, redis_url, namespace="", expiration_seconds=3600):
+        self.namespace = namespace
+        self.expiration_seconds = expiration_seconds
+        self.client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(redis_url))
+
+    def _make_key(self, question: str) -> str:
+        """Cache-Schlüssel aus Namespace (z.B. Modellname) und Frage bilden"""
+        digest = hashlib.blake2b(f"{self.namespace}:{question}".encode(), digest_size=16).hexdigest()
+        return self.KEY_PREFIX + digest
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """Gespeicherte Antwort abrufen, None wenn nicht vorhanden oder Redis nicht erreichbar"""
+        try:
+            raw = self.client.get(self._make_key(question))
+            if raw is None:
+                return None
+            logger.info("Antwort aus dem Cache geladen")
+            return orjson.loads(raw)
+        except Exception as e:
+            logger.warning(f"Fehler beim Lesen aus dem Antwort-Cache: {str(e)}")
+            return None
+
+    def set(self, question: str, response: Dict[str, Any]):
+        """Antwort speichern, Redis entfernt sie nach Ablauf der TTL selbst"""
+        try:
+            self.client.set(self._make_key(question), orjson.dumps(response), ex=self.expiration_seconds)
+        except Exception as e:
+            logger.warning(f"Fehler beim Schreiben in den Antwort-Cache: {str(e)}")
+
+    def clear(self):
+        """Alle gespeicherten Antworten löschen (z.B. nach einer Neuindexierung)"""
+        try:
+            deleted = 0
+            batch = []
+            for key in self.client.scan_iter(match=self.KEY_PREFIX + "*", count=1000):
+                batch.append(key)
+                if len(batch) >= 1000:
+                    deleted += self.client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += self.client.unlink(*batch)
+            logger.info(f"{deleted} Antworten aus dem Cache gelöscht")
+        except Exception as e:
+            logger.warning(f"Fehler beim Leeren des Antwort-Caches: {str(e)}")
@@ -1,36 +1,98 @@
+import atexit
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple
 import logging
+import threading
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 import numpy as np
+from contextlib import contextmanager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Qdrant-Clients pro Verbindung (URL, API-Key, Protokoll), damit Verbindungen wiederverwendet werden
+_CLIENT_CACHE = {}
+_CLIENT_LOCK = threading.Lock()
+
+
+def close_clients():
+    """Alle gemeinsam genutzten Qdrant-Clients schließen. Nur beim Beenden (oder in Tests) aufrufen,
+    da bestehende VectorStores ihren Client danach nicht mehr verwenden können."""
+    with _CLIENT_LOCK:
+        clients = list(_CLIENT_CACHE.values())
+        _CLIENT_CACHE.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Fehler beim Schließen der Qdrant-Verbindung: {str(e)}")
+
+
+# Verbindungen beim Beenden des Prozesses sauber schließen
+atexit.register(close_clients)
+
+
+class SimilarDoc(NamedTuple):
+    """Treffer einer Ähnlichkeitssuche"""
+    score: float
+    chunk_text: str
+    source: str
+    filename: str
+
+
 class VectorStore:
-    def __init__(self, url, collection_name, api_key=None):
+    # Standardwert von Qdrant für den Aufbau des HNSW-Index (in KB)
+    DEFAULT_INDEXING_THRESHOLD = 20000
+
+    def __init__(self, url, collection_name, api_key=None, prefer_grpc=True, grpc_port=6334, timeout=30,
+                 on_disk=False):
         self.url = url
         self.collection_name = collection_name
         self.api_key = api_key
+        self.prefer_grpc = prefer_grpc
+        self.grpc_port = grpc_port
+        self.timeout = timeout
+        # Originalvektoren, HNSW-Graph und Payload auf der Festplatte halten (nur die INT8-Codes bleiben im RAM)
+        self.on_disk = on_disk
         self.client = self._get_client()
         self._ensure_collection_exists()
 
+        if self.on_disk:
+            # Zufällige Lesezugriffe beim Rescoring profitieren stark vom io_uring-basierten Scorer des Servers
+            logger.info("Vektoren werden auf der Festplatte gehalten. Für schnellere Suchen im Qdrant-Server "
+                        "storage.performance.async_scorer aktivieren (QDRANT__STORAGE__PERFORMANCE__ASYNC_SCORER=true)")
+
     def _get_client(self):
-        """Qdrant-Client erstellen"""
-        try:
-            # Mit API-Schlüssel verbinden, falls vorhanden
-            if self.api_key:
-                client = QdrantClient(url=self.url, api_key=self.api_key)
-            else:
-                client = QdrantClient(url=self.url)
-
-            logger.info(f"Verbindung zu Qdrant auf {self.url} hergestellt")
-            return client
-        except Exception as e:
-            logger.error(f"Fehler bei der Verbindung zu Qdrant: {str(e)}")
-            raise
+        """Qdrant-Client erstellen oder einen bestehenden Client mit denselben Verbindungsdaten wiederverwenden"""
+        key = self._client_key()
+        with _CLIENT_LOCK:
+            client = _CLIENT_CACHE.get(key)
+            if client is not None:
+                return client
+
+            try:
+                # gRPC (HTTP/2, Protobuf) ist für Vektoren deutlich schlanker als REST/JSON
+                client = QdrantClient(
+                    url=self.url,
+                    api_key=self.api_key,
+                    prefer_grpc=self.prefer_grpc,
+                    grpc_port=self.grpc_port,
+                    timeout=self.timeout
+                )
+
+                _CLIENT_CACHE[key] = client
+                logger.info(f"Verbindung zu Qdrant auf {self.url} hergestellt (gRPC: {self.prefer_grpc})")
+                return client
+            except Exception as e:
+                logger.error(f"Fehler bei der Verbindung zu Qdrant: {str(e)}")
+                raise
+
+    def _client_key(self):
+        """Schlüssel für den Client-Cache aus den Verbindungsdaten"""
+        return self.url, self.api_key, self.prefer_grpc, self.grpc_port, self.timeout
 
     def _ensure_collection_exists(self):
         """Sicherstellen, dass die benötigte Collection existiert"""
@@ -43,70 +105,148 @@ class VectorStore:
                 collection_name=self.collection_name,
                 vectors_config=models.VectorParams(
                     size=1536,  # Standard-Größe für OpenAI-Embeddings
-                    distance=models.Distance.COSINE
+                    distance=models.Distance.COSINE,
+                    # Originalvektoren (für das Rescoring) in halber Genauigkeit speichern
+                    datatype=models.Datatype.FLOAT16,
+                    on_disk=self.on_disk
+                ),
+                hnsw_config=models.HnswConfigDiff(on_disk=self.on_disk),
+                on_disk_payload=self.on_disk,
+                # INT8-Quantisierung: ca. 4x kleinerer Suchindex im RAM, schnellere Suche
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8,
+                        # Ausreißer (oberstes/unterstes Prozent) nicht in den Wertebereich einbeziehen
+                        quantile=0.99,
+                        always_ram=True
+                    )
                 )
             )
             logger.info(f"Collection '{self.collection_name}' erstellt")
 
-    def store_embeddings(self, chunk_embeddings: List[Dict[str, Any]]):
-        """Embeddings in Qdrant speichern"""
+    def store_embeddings(self, chunks: List[Dict[str, Any]], vectors: np.ndarray, start_id: int = 0):
+        """Embeddings in Qdrant speichern (vectors: float32-Matrix, eine Zeile pro Chunk).
+        Bei gruppenweisem Speichern vergibt start_id fortlaufende IDs über alle Gruppen."""
         try:
-            # Chunks in Batches von 100 speichern
-            batch_size = 100
-            for i in range(0, len(chunk_embeddings), batch_size):
-                batch = chunk_embeddings[i:i + batch_size]
-
-                points = []
-                for idx, chunk in enumerate(batch):
-                    points.append(
-                        models.PointStruct(
-                            id=idx + i,  # Unique ID
-                            vector=chunk["embedding"],
-                            payload={
-                                "chunk_text": chunk["chunk_text"],
-                                "source": chunk["source"],
-                                "filename": chunk["filename"]
-                            }
-                        )
-                    )
+            if not chunks:
+                logger.info("Keine Embeddings zum Speichern vorhanden")
+                return True
 
-                # Punkte in die Collection upserten
-                self.client.upsert(
-                    collection_name=self.collection_name,
-                    points=points
-                )
+            payloads = [
+                {
+                    "chunk_text": chunk["chunk_text"],
+                    "source": chunk["source"],
+                    "filename": chunk["filename"]
+                }
+                for chunk in chunks
+            ]
+
+            # Bulk-Upload in Batches über den bestehenden Client. parallel > 1 würde bei jedem Aufruf einen
+            # neuen Prozess-Pool mit eigenen Clients starten. wait=True, damit Fehler hier auffallen und die
+            # Punkte übernommen sind, bevor die Indexierung wieder aktiviert wird
+            self.client.upload_collection(
+                collection_name=self.collection_name,
+                vectors=vectors,
+                payload=payloads,
+                ids=list(range(start_id, start_id + len(chunks))),
+                batch_size=256,
+                parallel=1,
+                wait=True
+            )
 
-            logger.info(f"{len(chunk_embeddings)} Embeddings in Qdrant gespeichert")
+            logger.info(f"{len(chunks)} Embeddings in Qdrant gespeichert")
             return True
         except Exception as e:
             logger.error(f"Fehler beim Speichern der Embeddings: {str(e)}")
             raise
 
-    def search_similar(self, query_embedding, limit=5):
-        """Ähnliche Dokumente zu einem Query-Embedding finden"""
+    @contextmanager
+    def pause_indexing(self):
+        """HNSW-Indexierung während eines Massenimports pausieren und danach wieder aktivieren"""
+        self._set_indexing_threshold(0)
+        logger.info(f"Indexierung für Collection '{self.collection_name}' pausiert")
         try:
-            results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=limit
-            )
+            yield self
+        finally:
+            self._set_indexing_threshold(self.DEFAULT_INDEXING_THRESHOLD)
+            logger.info(f"Indexierung für Collection '{self.collection_name}' wieder aktiviert")
 
-            # Ergebnisse formatieren
-            formatted_results = []
-            for res in results:
-                formatted_results.append({
-                    "score": res.score,
-                    "chunk_text": res.payload.get("chunk_text"),
-                    "source": res.payload.get("source"),
-                    "filename": res.payload.get("filename")
-                })
+    def _set_indexing_threshold(self, indexing_threshold):
+        """Schwellwert für den Aufbau des HNSW-Index setzen (0 = Indexierung pausieren)"""
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+        )
 
+    def search_similar(self, query_embedding, limit=5, hnsw_ef=None, oversampling=2.0,
+                       score_threshold=None) -> List[SimilarDoc]:
+        """Ähnliche Dokumente zu einem Query-Embedding finden.
+        hnsw_ef und oversampling verschieben das Verhältnis von Genauigkeit zu Geschwindigkeit."""
+        try:
+            results = self.client.query_points(
+                collection_name=self.collection_name,
+                query=query_embedding,
+                limit=limit,
+                search_params=self._search_params(hnsw_ef, oversampling),
+                score_threshold=score_threshold,
+                with_payload=True
+            ).points
+
+            formatted_results = self._to_similar_docs(results)
             logger.info(f"{len(formatted_results)} ähnliche Dokumente gefunden")
             return formatted_results
         except Exception as e:
             logger.error(f"Fehler bei der Suche nach ähnlichen Dokumenten: {str(e)}")
             raise
 
+    def search_similar_batch(self, query_embeddings, limit=5, hnsw_ef=None, oversampling=2.0,
+                             score_threshold=None) -> List[List[SimilarDoc]]:
+        """Ähnliche Dokumente für mehrere Query-Embeddings mit einem einzigen Request finden"""
+        try:
+            search_params = self._search_params(hnsw_ef, oversampling)
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    models.QueryRequest(
+                        # float32-Zeilen als Python-floats übergeben, QueryRequest prüft streng auf float
+                        query=np.asarray(query_embedding, dtype=np.float32).tolist(),
+                        limit=limit,
+                        with_payload=True,
+                        params=search_params,
+                        score_threshold=score_threshold
+                    )
+                    for query_embedding in query_embeddings
+                ]
+            )
+
+            formatted_results = [self._to_similar_docs(response.points) for response in responses]
+            logger.info(f"Ähnliche Dokumente für {len(formatted_results)} Anfragen gefunden")
+            return formatted_results
+        except Exception as e:
+            logger.error(f"Fehler bei der Batch-Suche nach ähnlichen Dokumenten: {str(e)}")
+            raise
+
+    @staticmethod
+    def _search_params(hnsw_ef=None, oversampling=2.0) -> models.SearchParams:
+        """Suchparameter: Kandidaten über quantisierte Vektoren finden, danach mit Originalvektoren neu bewerten"""
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef,
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+        )
+
+    @staticmethod
+    def _to_similar_docs(results) -> List[SimilarDoc]:
+        """Suchergebnisse einmalig in leichtgewichtige Tupel überführen"""
+        return [
+            SimilarDoc(
+                score=res.score,
+                chunk_text=res.payload.get("chunk_text"),
+                source=res.payload.get("source"),
+                filename=res.payload.get("filename")
+            )
+            for res in results
+        ]
+
     def clear_collection(self):
         """Collection leeren (nützlich für Neuladen der Daten)"""
         try:
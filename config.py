@@ -11,6 +11,8 @@ class Config:
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
     OPENAI_EMBEDDING_MODEL = os.environ.get('OPENAI_EMBEDDING_MODEL', 'text-embedding-ada-002')
+    OPENAI_MAX_CONCURRENT_REQUESTS = int(os.environ.get('OPENAI_MAX_CONCURRENT_REQUESTS', 5))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 5))
 
     # Dropbox Konfiguration
     DROPBOX_ACCESS_TOKEN = os.environ.get('DROPBOX_ACCESS_TOKEN')
@@ -20,11 +22,19 @@ class Config:
     QDRANT_URL = os.environ.get('QDRANT_URL', 'http://localhost:6333')
     QDRANT_API_KEY = os.environ.get('QDRANT_API_KEY')
     QDRANT_COLLECTION_NAME = os.environ.get('QDRANT_COLLECTION_NAME', 'pdf_documents')
+    QDRANT_PREFER_GRPC = os.environ.get('QDRANT_PREFER_GRPC', 'true').lower() == 'true'
+    QDRANT_GRPC_PORT = int(os.environ.get('QDRANT_GRPC_PORT', 6334))
+    # Vektoren, HNSW-Graph und Payload auf der Festplatte statt im RAM (für große Collections)
+    QDRANT_ON_DISK = os.environ.get('QDRANT_ON_DISK', 'false').lower() == 'true'
+
+    # Antwort-Cache (Redis), deaktiviert wenn keine REDIS_URL gesetzt ist
+    REDIS_URL = os.environ.get('REDIS_URL')
+    CACHE_EXPIRATION_SECONDS = int(os.environ.get('CACHE_EXPIRATION_SECONDS', 3600))
+
+    # Embedding-Cache (SQLite), leerer Pfad deaktiviert den Cache
+    EMBEDDING_CACHE_PATH = os.environ.get(
+        'EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_cache.sqlite3'))
 
     # PDF-Verarbeitungskonfiguration
     CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 1000))
     CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 200))
-
-    # Anwendungskonfiguration
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp_pdfs')
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
\ No newline at end of file
@@ -1,22 +1,32 @@
 import os
+import sys
 import dropbox
 from dropbox.exceptions import AuthError, ApiError
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # .env-Datei laden
 load_dotenv()
 
+# Umrechnungsfaktor von Bytes in Megabytes
+BYTES_TO_MB = 1 / (1024 * 1024)
 
-def check_dropbox_permissions(dbx):
-    """Überprüft, ob das Token die richtigen Berechtigungen hat"""
-    print("Überprüfe Dropbox-Berechtigungen...")
+# Bei umgeleiteter Ausgabe (Datei, Pipe) eine tabulatorgetrennte Liste statt der Baumansicht schreiben
+IS_TTY = sys.stdout.isatty()
+# Vorberechnete Einrückungen, damit pro Eintrag kein neuer String entsteht
+INDENTS = ["  " * i for i in range(64)]
+
+# Benötigte Berechtigungen (Reihenfolge bleibt für die Ausgabe fehlender Scopes erhalten)
+REQUIRED_SCOPES = ('files.metadata.read', 'files.content.read')
 
-    # Liste der benötigten Berechtigungen
-    required_scopes = ['files.metadata.read', 'files.content.read']
+
+def check_dropbox_permissions(token_info_future):
+    """Überprüft anhand der bereits gestarteten check_user-Anfrage, ob das Token die richtigen Berechtigungen hat"""
+    print("Überprüfe Dropbox-Berechtigungen...")
 
     try:
         # Token-Info abrufen
-        token_info = dbx.check_user(query="echo")
+        token_info = token_info_future.result()
 
         # Ausgabe der vorhandenen Scopes, wenn verfügbar
         if hasattr(token_info, 'scopes'):
@@ -25,7 +35,8 @@ def check_dropbox_permissions(dbx):
                 print(f" - {scope}")
 
             # Überprüfen, ob alle erforderlichen Scopes vorhanden sind
-            missing_scopes = [scope for scope in required_scopes if scope not in token_info.scopes]
+            available_scopes = frozenset(token_info.scopes)
+            missing_scopes = [scope for scope in REQUIRED_SCOPES if scope not in available_scopes]
             if missing_scopes:
                 print("\nFEHLENDE BERECHTIGUNGEN:")
                 for scope in missing_scopes:
@@ -55,75 +66,116 @@ def list_dropbox_structure(access_token, start_path=''):
         print("Verbinde mit Dropbox...")
         dbx = dropbox.Dropbox(access_token)
 
-        # Testen, ob das Token gültig ist
-        try:
-            account = dbx.users_get_current_account()
-            print(f"Verbunden mit Dropbox-Konto: {account.name.display_name}")
-            print(f"E-Mail: {account.email}")
-            print("-" * 50)
-        except AuthError:
-            print("ERROR: Ungültiges Access Token. Bitte prüfe dein Token in der .env-Datei.")
-            return
-
-        # Berechtigungen überprüfen
-        if not check_dropbox_permissions(dbx):
-            return
-
-        # Zugriff auf "files/list_folder" testen
-        print(f"\nTeste Zugriff auf Dropbox-Verzeichnis: {start_path or '/'}")
-        try:
-            # Versuche, den Inhalt des Startordners aufzulisten
-            dbx.files_list_folder(start_path)
-            print("Zugriff erfolgreich!")
-        except ApiError as e:
-            error_message = str(e)
-            if "files.metadata.read" in error_message:
-                print("FEHLER: Deine App hat nicht die erforderliche Berechtigung 'files.metadata.read'.")
-                print("Bitte füge diese Berechtigung in der Dropbox App Console hinzu und generiere ein neues Token.")
-            else:
-                print(f"FEHLER beim Zugriff auf Verzeichnis: {error_message}")
-            return
-
-        # Struktur rekursiv ausgeben
+        # Kontoabfrage, Berechtigungsprüfung und Verzeichnistest gleichzeitig starten,
+        # die Ergebnisse werden danach in der gewohnten Reihenfolge ausgewertet
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            account_future = executor.submit(dbx.users_get_current_account)
+            token_info_future = executor.submit(dbx.check_user, query="echo")
+            # Die erste Seite der rekursiven Auflistung dient zugleich als Zugriffstest
+            listing_future = executor.submit(
+                dbx.files_list_folder, start_path,
+                recursive=True, include_non_downloadable_files=False, limit=2000
+            )
+
+            first_page = check_startup(account_future, token_info_future, listing_future, start_path)
+            if first_page is None:
+                return
+
+        # Struktur ausgeben
         print("\nDropbox-Struktur:")
         print("-" * 50)
-        list_structure_recursive(dbx, start_path, 0)
+        list_structure(dbx, start_path, first_page)
 
     except Exception as e:
         print(f"Ein Fehler ist aufgetreten: {str(e)}")
 
 
-def list_structure_recursive(dbx, path, level):
+def check_startup(account_future, token_info_future, listing_future, start_path):
     """
-    Gibt rekursiv die Ordner- und Dateistruktur aus.
+    Wertet die parallel gestarteten Startprüfungen aus.
+    Gibt die erste Seite der Auflistung zurück oder None, wenn nicht fortgefahren werden kann.
     """
+    # Testen, ob das Token gültig ist
     try:
-        # Ordnerinhalt abrufen
-        res = dbx.files_list_folder(path)
+        account = account_future.result()
+        print(f"Verbunden mit Dropbox-Konto: {account.name.display_name}")
+        print(f"E-Mail: {account.email}")
+        print("-" * 50)
+    except AuthError:
+        print("ERROR: Ungültiges Access Token. Bitte prüfe dein Token in der .env-Datei.")
+        return None
 
-        # Funktion zum Verarbeiten von Einträgen
-        def process_entries(entries):
-            for entry in entries:
-                indent = "  " * level
+    # Berechtigungen überprüfen
+    if not check_dropbox_permissions(token_info_future):
+        return None
 
-                if isinstance(entry, dropbox.files.FolderMetadata):
-                    # Ordner
-                    print(f"{indent}📁 {entry.name} (Pfad: {entry.path_display})")
-                    # Rekursiv in den Ordner gehen
-                    list_structure_recursive(dbx, entry.path_lower, level + 1)
+    # Zugriff auf "files/list_folder" testen
+    print(f"\nTeste Zugriff auf Dropbox-Verzeichnis: {start_path or '/'}")
+    try:
+        # Versuche, den Inhalt des Startordners aufzulisten
+        first_page = listing_future.result()
+        print("Zugriff erfolgreich!")
+    except ApiError as e:
+        error_message = str(e)
+        if "files.metadata.read" in error_message:
+            print("FEHLER: Deine App hat nicht die erforderliche Berechtigung 'files.metadata.read'.")
+            print("Bitte füge diese Berechtigung in der Dropbox App Console hinzu und generiere ein neues Token.")
+        else:
+            print(f"FEHLER beim Zugriff auf Verzeichnis: {error_message}")
+        return None
+
+    return first_page
 
-                elif isinstance(entry, dropbox.files.FileMetadata) and entry.name.lower().endswith('.pdf'):
-                    # PDF-Datei
-                    size_mb = entry.size / 1024 / 1024
-                    print(f"{indent}📄 {entry.name} ({size_mb:.2f} MB) (Pfad: {entry.path_display})")
 
-        # Erste Seite verarbeiten
-        process_entries(res.entries)
+def list_structure(dbx, path, res):
+    """
+    Gibt die Ordner- und Dateistruktur aus.
+    Der ganze Baum stammt aus einer rekursiven Auflistung (eine Anfrage pro Seite statt pro Ordner),
+    res ist deren bereits abgerufene erste Seite.
+    """
+    try:
+        entries = list(res.entries)
 
-        # Weitere Seiten verarbeiten, falls vorhanden
+        # Weitere Seiten abrufen, falls vorhanden
         while res.has_more:
             res = dbx.files_list_folder_continue(res.cursor)
-            process_entries(res.entries)
+            entries.extend(res.entries)
+
+        # Nach Pfadbestandteilen sortieren, damit jeder Ordner direkt vor seinem Inhalt steht
+        entries.sort(key=lambda entry: entry.path_lower.split('/'))
+
+        root_path = path.rstrip('/').lower()
+        base_depth = root_path.count('/') + 1
+
+        # Ausgabe sammeln und am Ende in einem Stück schreiben
+        lines = []
+        for entry in entries:
+            # Die rekursive Auflistung enthält auch den Startordner selbst
+            if entry.path_lower == root_path:
+                continue
+
+            # Einrückung aus der Tiefe des Pfads ableiten
+            if IS_TTY:
+                depth = entry.path_lower.count('/') - base_depth
+                indent = INDENTS[depth] if depth < len(INDENTS) else "  " * depth
+
+            if isinstance(entry, dropbox.files.FolderMetadata):
+                # Ordner
+                if IS_TTY:
+                    lines.append(f"{indent}📁 {entry.name} (Pfad: {entry.path_display})")
+                else:
+                    lines.append(f"D\t{entry.path_display}")
+
+            elif isinstance(entry, dropbox.files.FileMetadata) and entry.name[-4:].lower() == '.pdf':
+                # PDF-Datei
+                if IS_TTY:
+                    size_mb = entry.size * BYTES_TO_MB
+                    lines.append(f"{indent}📄 {entry.name} ({size_mb:.2f} MB) (Pfad: {entry.path_display})")
+                else:
+                    lines.append(f"F\t{entry.path_display}\t{entry.size}")
+
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
 
     except dropbox.exceptions.ApiError as e:
         print(f"Fehler beim Durchsuchen von {path}: {str(e)}")